@@ -0,0 +1,31 @@
+from __future__ import annotations
+import queue
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from sentence_transformers import SentenceTransformer
+
+
+class EmbedderPool:
+    """Fixed set of embedding models shared by every session in the process.
+
+    `acquire()` blocks until a model is free, so at most `size` encodes run
+    concurrently and memory stays at `size` model copies regardless of how
+    many Streamlit sessions are open.
+    """
+
+    def __init__(self, factory: Callable[[], SentenceTransformer], size: int = 2):
+        if size < 1:
+            raise ValueError("EmbedderPool size must be at least 1")
+        self.size = size
+        self._q: "queue.Queue[SentenceTransformer]" = queue.Queue()
+        for _ in range(size):
+            self._q.put(factory())
+
+    @contextmanager
+    def acquire(self) -> Iterator[SentenceTransformer]:
+        model = self._q.get()
+        try:
+            yield model
+        finally:
+            self._q.put(model)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ingestion.embedding import embeds_path, int8_ranges_path, quantize_int8, records_path
+
+# Rows scored per step for int8 matrices, bounding the int32 temporary (~24 MB at dim 384)
+SCORE_CHUNK_ROWS = 16384
+
+
+class FlatIndex:
+    """Exact top-k search over a memory-mapped embedding matrix.
+
+    One matrix-vector product per query beats HNSW for small corpora and
+    avoids Chroma's SQLite round-trips. Distances follow Chroma's cosine/ip
+    convention (1 - score) so results are interchangeable.
+    """
+
+    def __init__(self, persist_dir: Path, collection_name: str):
+        self.embeds = np.load(embeds_path(persist_dir, collection_name), mmap_mode="r")
+        records = json.loads(records_path(persist_dir, collection_name).read_text())
+        self.ids: List[str] = records["ids"]
+        self.documents: List[str] = records["documents"]
+        self.metadatas: List[Dict] = records["metadatas"]
+        self.ranges: Optional[np.ndarray] = None
+        if self.embeds.dtype == np.int8:
+            self.ranges = np.load(int8_ranges_path(persist_dir, collection_name))
+
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        if self.ranges is None:
+            # float32 matrix: the product reads the mmap directly, no copy
+            return self.embeds @ q.astype(np.float32, copy=False).T
+        # int8 matrix: score exactly in int32 (|dot| <= dim * 128**2), a
+        # bounded slice at a time instead of upcasting the whole matrix
+        q32 = q.astype(np.int32).T
+        n = self.embeds.shape[0]
+        scores = np.empty((n, q32.shape[1]), dtype=np.int32)
+        for start in range(0, n, SCORE_CHUNK_ROWS):
+            stop = min(start + SCORE_CHUNK_ROWS, n)
+            np.matmul(self.embeds[start:stop].astype(np.int32), q32, out=scores[start:stop])
+        return scores
+
+    def query(self, q_embs: np.ndarray, k: int) -> List[List[Dict]]:
+        """Return, for each query row, the k nearest records best-first."""
+        q = np.atleast_2d(q_embs)
+        if self.ranges is not None:
+            q = quantize_int8(q, self.ranges)
+        scores = self._scores(q)  # (N, Q)
+        k = min(k, scores.shape[0])
+        if k == 0:
+            return [[] for _ in range(q.shape[0])]
+
+        results: List[List[Dict]] = []
+        for col in scores.T:
+            top = np.argpartition(-col, k - 1)[:k]
+            top = top[np.argsort(-col[top])]
+            results.append(
+                [
+                    {
+                        "id": self.ids[i],
+                        "document": self.documents[i],
+                        "metadata": self.metadatas[i],
+                        "distance": float(1.0 - col[i]),
+                    }
+                    for i in top.tolist()
+                ]
+            )
+        return results
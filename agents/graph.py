@@ -1,33 +1,49 @@
 from __future__ import annotations
+import asyncio
 import os
+import queue
 import re
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional, TypedDict
+from typing import Dict, Iterator, List, Optional, Tuple, TypedDict
 
+import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 import chromadb
 
 from langgraph.graph import StateGraph, START, END
 
-from agents.llm import answer_with_citations
+from agents.embedder_pool import EmbedderPool
+from agents.flat_index import FlatIndex
+from agents.llm import aanswer_with_citations, get_llm_loop
+from ingestion.embedding import encode_float32, int8_ranges_path, load_embedder, quantize_int8
 
 # ---- Env ----
 load_dotenv()
 CHROMA_DB_DIR = os.environ.get("CHROMA_DB_DIR", "data/chroma")
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
 COLLECTION_NAME = "pwb_docs"
+INDEX_BACKEND = os.environ.get("INDEX_BACKEND", "chroma").lower()  # "chroma" | "flat"
+EMBED_POOL_SIZE = int(os.environ.get("EMBED_POOL_SIZE", "2"))
+SEM_CACHE_TAU = float(os.environ.get("SEM_CACHE_TAU", "0.97"))
+SEM_CACHE_MAXSIZE = int(os.environ.get("SEM_CACHE_MAXSIZE", "1000"))
+SEM_CACHE_TTL = float(os.environ.get("SEM_CACHE_TTL", "300"))
 
 
 # ---- Caches ----
-_embedder: Optional[SentenceTransformer] = None
+_embedder_pool: Optional[EmbedderPool] = None
+_embedder_pool_lock = threading.Lock()
 _collection = None
 
-def get_embedder() -> SentenceTransformer:
-    global _embedder
-    if _embedder is None:
-        _embedder = SentenceTransformer(EMBEDDING_MODEL)
-    return _embedder
+def get_embedder_pool() -> EmbedderPool:
+    global _embedder_pool
+    if _embedder_pool is None:
+        with _embedder_pool_lock:
+            if _embedder_pool is None:
+                _embedder_pool = EmbedderPool(lambda: load_embedder(EMBEDDING_MODEL), size=EMBED_POOL_SIZE)
+    return _embedder_pool
 
 
 def get_collection():
@@ -38,6 +54,84 @@ def get_collection():
     return _collection
 
 
+_flat_index: Optional[FlatIndex] = None
+
+def get_flat_index() -> FlatIndex:
+    global _flat_index
+    if _flat_index is None:
+        _flat_index = FlatIndex(Path(CHROMA_DB_DIR), COLLECTION_NAME)
+    return _flat_index
+
+
+_int8_ranges: Optional[np.ndarray] = None
+
+def get_int8_ranges() -> np.ndarray:
+    global _int8_ranges
+    if _int8_ranges is None:
+        _int8_ranges = np.load(int8_ranges_path(Path(CHROMA_DB_DIR), COLLECTION_NAME))
+    return _int8_ranges
+
+
+def to_index_embedding(q_emb: np.ndarray) -> np.ndarray:
+    """Match query embedding(s) to the precision the collection was built with."""
+    precision = (get_collection().metadata or {}).get("embedding_precision", "float32")
+    if precision == "int8":
+        q_emb = quantize_int8(q_emb, get_int8_ranges())
+    return q_emb.astype(np.float32, copy=False)
+
+
+# ---- Semantic query cache ----
+# (query, top_k) -> (normalized query embedding, contexts, monotonic insert time).
+# Exact repeats hit the dict directly; paraphrases are matched by cosine
+# similarity against the cached embeddings (dot product, since normalized).
+_SEM_CACHE: "OrderedDict[Tuple[str, int], Tuple[np.ndarray, List[Dict], float]]" = OrderedDict()
+_sem_cache_lock = threading.Lock()
+
+
+def _sem_cache_get_exact(query: str, top_k: int) -> Optional[List[Dict]]:
+    now = time.monotonic()
+    with _sem_cache_lock:
+        entry = _SEM_CACHE.get((query, top_k))
+        if entry is None:
+            return None
+        if now - entry[2] > SEM_CACHE_TTL:
+            del _SEM_CACHE[(query, top_k)]
+            return None
+        _SEM_CACHE.move_to_end((query, top_k))
+        return entry[1]
+
+
+def _sem_cache_get_similar(q_emb: np.ndarray, top_k: int) -> Optional[Tuple[List[Dict], float]]:
+    """Return (contexts, insert time) of the closest cached query above SEM_CACHE_TAU."""
+    now = time.monotonic()
+    with _sem_cache_lock:
+        expired = [k for k, v in _SEM_CACHE.items() if now - v[2] > SEM_CACHE_TTL]
+        for k in expired:
+            del _SEM_CACHE[k]
+        keys = [k for k in _SEM_CACHE if k[1] == top_k]
+        if not keys:
+            return None
+        cached = np.stack([_SEM_CACHE[k][0] for k in keys])
+        sims = cached @ q_emb
+        best = int(np.argmax(sims))
+        if sims[best] < SEM_CACHE_TAU:
+            return None
+        _SEM_CACHE.move_to_end(keys[best])
+        entry = _SEM_CACHE[keys[best]]
+        return entry[1], entry[2]
+
+
+def _sem_cache_put(
+    query: str, top_k: int, q_emb: np.ndarray, contexts: List[Dict], ts: Optional[float] = None
+) -> None:
+    """Insert an entry; `ts` carries over the insert time of reused contexts."""
+    with _sem_cache_lock:
+        _SEM_CACHE[(query, top_k)] = (q_emb, contexts, time.monotonic() if ts is None else ts)
+        _SEM_CACHE.move_to_end((query, top_k))
+        while len(_SEM_CACHE) > SEM_CACHE_MAXSIZE:
+            _SEM_CACHE.popitem(last=False)
+
+
 # ---- State ----
 class AgentState(TypedDict, total=False):
     query: str
@@ -45,19 +139,26 @@ class AgentState(TypedDict, total=False):
     top_k: int
     style: str
     temperature: float
+    stream: bool
     contexts: List[Dict]
     answer: str
     proposed_action: Dict
     log: List[str]
 
 
+# ---- Patterns ----
+# Same keywords the router used to scan for as substrings ("unpause" contains "pause")
+_ACTION_RE = re.compile(r"pause|resume|(?:update|change|set) hours", re.IGNORECASE)
+# Inline citation of the form [filename pX]
+_CITATION_RE = re.compile(r"\[[^\]]+ p\d+\]")
+
+
 # ---- Nodes ----
 def router_node(state: AgentState) -> AgentState:
-    q = (state.get("query") or "").lower()
+    q = state.get("query") or ""
     log = state.get("log", [])
 
-    action_keywords = ["pause", "unpause", "resume", "update hours", "change hours", "set hours"]
-    if any(k in q for k in action_keywords):
+    if _ACTION_RE.search(q):
         intent = "action"
     else:
         intent = "knowledge"
@@ -71,21 +172,48 @@ def router_node(state: AgentState) -> AgentState:
 def retriever_node(state: AgentState) -> AgentState:
     top_k = state.get("top_k", 4)
     query = state["query"]
-    model = get_embedder()
-    coll = get_collection()
+    log = state.get("log", [])
 
-    q_emb = model.encode([query], normalize_embeddings=True).tolist()
-    res = coll.query(query_embeddings=q_emb, n_results=top_k, include=["distances", "metadatas", "documents"])  # type: ignore
+    contexts = _sem_cache_get_exact(query, top_k)
+    if contexts is not None:
+        log.append("Retriever → Compose (cache hit)")
+        state["contexts"] = contexts
+        state["log"] = log
+        return state
+
+    with get_embedder_pool().acquire() as model:
+        q_emb = encode_float32(model, [query], normalize_embeddings=True)[0]
+
+    hit = _sem_cache_get_similar(q_emb, top_k)
+    if hit is not None:
+        # Keep the original timestamp so paraphrase chains still expire
+        contexts, ts = hit
+        _sem_cache_put(query, top_k, q_emb, contexts, ts=ts)
+        log.append("Retriever → Compose (semantic cache hit)")
+        state["contexts"] = contexts
+        state["log"] = log
+        return state
+
+    if INDEX_BACKEND == "flat":
+        contexts = [
+            {"document": h["document"], "metadata": h["metadata"], "distance": h["distance"]}
+            for h in get_flat_index().query(q_emb, top_k)[0]
+        ]
+    else:
+        coll = get_collection()
+        res = coll.query(query_embeddings=to_index_embedding(q_emb[None, :]), n_results=top_k, include=["distances", "metadatas", "documents"])  # type: ignore
 
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
-    dists = res.get("distances", [[]])[0]
+        docs = res.get("documents", [[]])[0]
+        metas = res.get("metadatas", [[]])[0]
+        dists = res.get("distances", [[]])[0]
 
-    contexts: List[Dict] = []
-    for doc, meta, dist in zip(docs, metas, dists):
-        contexts.append({"document": doc, "metadata": meta, "distance": dist})
+        contexts = []
+        for doc, meta, dist in zip(docs, metas, dists):
+            contexts.append({"document": doc, "metadata": meta, "distance": dist})
+    if contexts:
+        # An empty result (index missing or not built yet) must not answer repeats
+        _sem_cache_put(query, top_k, q_emb, contexts)
 
-    log = state.get("log", [])
     log.append("Retriever → Compose")
 
     state["contexts"] = contexts
@@ -93,14 +221,21 @@ def retriever_node(state: AgentState) -> AgentState:
     return state
 
 
-def compose_node(state: AgentState) -> AgentState:
+async def compose_node(state: AgentState) -> AgentState:
+    log = state.get("log", [])
+    if state.get("stream"):
+        # The caller streams the answer itself from state["contexts"]
+        log.append("Compose → Critic (deferred to stream)")
+        state["answer"] = ""
+        state["log"] = log
+        return state
+
     query = state["query"]
     contexts = state.get("contexts", [])
     style = state.get("style", "detailed")
     temp = state.get("temperature", 0.2)
-    answer = answer_with_citations(query, contexts, temperature=temp, style=style)
+    answer = await aanswer_with_citations(query, contexts, temperature=temp, style=style)
 
-    log = state.get("log", [])
     log.append("Compose → Critic")
 
     state["answer"] = answer
@@ -110,10 +245,15 @@ def compose_node(state: AgentState) -> AgentState:
 
 def critic_node(state: AgentState) -> AgentState:
     # Simple grounding check: require at least one [filename pX] pattern
+    log = state.get("log", [])
+    if state.get("stream"):
+        log.append("Critic → END (grounded=n/a, streamed)")
+        state["log"] = log
+        return state
+
     answer = state.get("answer", "")
-    grounded = bool(re.search(r"\[[^\]]+ p\d+\]", answer))
+    grounded = bool(_CITATION_RE.search(answer))
 
-    log = state.get("log", [])
     log.append(f"Critic → END (grounded={grounded})")
     state["log"] = log
     return state
@@ -197,11 +337,89 @@ def get_graph():
     return _graph
 
 
-def invoke_graph(query: str, top_k: int = 4, style: str | None = None, temperature: float = 0.2) -> AgentState:
-    graph = get_graph()
+def _initial_state(query: str, top_k: int, style: str | None, temperature: float, stream: bool) -> AgentState:
     init: AgentState = {"query": query, "top_k": top_k, "log": []}
     if style:
         init["style"] = style
     init["temperature"] = temperature
-    result: AgentState = graph.invoke(init)  # type: ignore
+    init["stream"] = stream
+    return init
+
+
+async def ainvoke_graph(
+    query: str,
+    top_k: int = 4,
+    style: str | None = None,
+    temperature: float = 0.2,
+    stream: bool = False,
+) -> AgentState:
+    graph = get_graph()
+    init = _initial_state(query, top_k, style, temperature, stream)
+    result: AgentState = await graph.ainvoke(init)  # type: ignore
     return result
+
+
+def invoke_graph(
+    query: str,
+    top_k: int = 4,
+    style: str | None = None,
+    temperature: float = 0.2,
+    stream: bool = False,
+) -> AgentState:
+    """Blocking wrapper around `ainvoke_graph` for synchronous callers.
+
+    The graph runs on the shared LLM loop thread, so this also works from a
+    thread that already has a running loop (it blocks that thread, though;
+    async code should await `ainvoke_graph` instead).
+
+    With stream=True the knowledge path stops after retrieval and leaves
+    "answer" empty so the caller can stream it from "contexts".
+    """
+    fut = asyncio.run_coroutine_threadsafe(
+        ainvoke_graph(
+            query,
+            top_k=top_k,
+            style=style,
+            temperature=temperature,
+            stream=stream,
+        ),
+        get_llm_loop(),
+    )
+    return fut.result()
+
+
+def stream_graph(
+    query: str,
+    top_k: int = 4,
+    style: str | None = None,
+    temperature: float = 0.2,
+    stream: bool = False,
+) -> Iterator[Tuple[str, AgentState]]:
+    """Like `invoke_graph`, but yield (node name, state so far) as each node finishes.
+
+    Lets a synchronous caller (the Streamlit script thread) report progress
+    while the graph is still running on the LLM loop. The last state yielded
+    is the final result; errors from the run are raised here.
+    """
+    init = _initial_state(query, top_k, style, temperature, stream)
+    updates: "queue.SimpleQueue" = queue.SimpleQueue()
+    done = object()
+
+    async def pump() -> None:
+        try:
+            async for chunk in get_graph().astream(init, stream_mode="updates"):  # type: ignore
+                for node, update in chunk.items():
+                    updates.put((node, update))
+        finally:
+            updates.put(done)
+
+    fut = asyncio.run_coroutine_threadsafe(pump(), get_llm_loop())
+    state: AgentState = dict(init)  # type: ignore
+    while True:
+        item = updates.get()
+        if item is done:
+            break
+        node, update = item
+        state.update(update or {})
+        yield node, state
+    fut.result()  # re-raise anything the run failed with
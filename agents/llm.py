@@ -1,18 +1,26 @@
 from __future__ import annotations
+import asyncio
 import os
-from typing import List, Dict, Optional
+import threading
+from collections import OrderedDict
+from typing import Any, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 # Optional import; only needed if GROQ_API_KEY is set
 try:
-    from groq import Groq  # type: ignore
+    from groq import AsyncGroq, Groq  # type: ignore
 except Exception:  # pragma: no cover
+    AsyncGroq = None  # type: ignore
     Groq = None  # type: ignore
 
 load_dotenv()
 
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 GROQ_MODEL = os.environ.get("GROQ_MODEL", "openai/gpt-oss-20b")
+GROQ_MAX_CONCURRENCY = int(os.environ.get("GROQ_MAX_CONCURRENCY", "8"))
+# Prompt context caps (characters; roughly 4 chars per token)
+LLM_CTX_CHUNK_CHARS = 1200
+LLM_CTX_BUDGET_CHARS = int(os.environ.get("LLM_CTX_BUDGET_CHARS", "6000"))
 
 _client: Optional["Groq"] = None
 
@@ -24,6 +32,36 @@ def get_llm_client() -> Optional["Groq"]:
         _client = Groq(api_key=GROQ_API_KEY)
     return _client
 
+
+# The async client's HTTP pool and the semaphore are bound to the event loop
+# they are first used on, so both live on one long-lived loop thread. Callers
+# on any other loop (or none) submit work to it, which keeps connections
+# reused and GROQ_MAX_CONCURRENCY process-wide.
+_llm_loop: Optional[asyncio.AbstractEventLoop] = None
+_llm_loop_lock = threading.Lock()
+_async_client: Optional["AsyncGroq"] = None
+_async_semaphore: Optional[asyncio.Semaphore] = None
+
+def get_llm_loop() -> asyncio.AbstractEventLoop:
+    global _llm_loop
+    if _llm_loop is None:
+        with _llm_loop_lock:
+            if _llm_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+                _llm_loop = loop
+    return _llm_loop
+
+
+async def _acreate_completion(**kwargs: Any):
+    # Only ever runs on the LLM loop, so no lock is needed around the lazy init
+    global _async_client, _async_semaphore
+    if _async_client is None:
+        _async_client = AsyncGroq(api_key=GROQ_API_KEY)
+        _async_semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+    async with _async_semaphore:
+        return await _async_client.chat.completions.create(**kwargs)
+
 SYSTEM_PROMPT = (
     "You are an operations copilot for finance, menu, onboarding, and platform workflows. "
     "Use ONLY the provided context to answer. If the context is insufficient, say you are unsure and list what is missing. "
@@ -36,15 +74,84 @@ SYSTEM_PROMPT = (
     "Do NOT reveal chain-of-thought; return only the final answer."
 )
 
-def format_context_block(contexts: List[Dict]) -> str:
+# Formatted context blocks, keyed by the contexts' identity and the caps
+_CTX_BLOCK_CACHE: "OrderedDict[Tuple, str]" = OrderedDict()
+_CTX_BLOCK_CACHE_SIZE = 256
+_ctx_block_lock = threading.Lock()
+
+
+def _fmt_key(contexts: List[Dict], max_ctx_chars: int, max_total_chars: int) -> Tuple:
+    # The document string itself is part of the key: str caches its hash, so
+    # this stays cheap on repeat lookups and cannot collide across chunks
+    return (
+        max_ctx_chars,
+        max_total_chars,
+        tuple(
+            (
+                c.get("metadata", {}).get("filename"),
+                c.get("metadata", {}).get("page"),
+                c.get("metadata", {}).get("chunk"),
+                c.get("distance"),
+                c.get("document", ""),
+            )
+            for c in contexts
+        ),
+    )
+
+
+def format_context_block(
+    contexts: List[Dict],
+    max_ctx_chars: int = LLM_CTX_CHUNK_CHARS,
+    max_total_chars: int = LLM_CTX_BUDGET_CHARS,
+) -> str:
+    """Join contexts best-first, truncating each one and stopping at the budget.
+
+    The best-ranked context is always kept so the prompt is never empty.
+    Results are memoized, so formatting the same contexts twice is a lookup.
+    """
+    key = _fmt_key(contexts, max_ctx_chars, max_total_chars)
+    with _ctx_block_lock:
+        block = _CTX_BLOCK_CACHE.get(key)
+        if block is not None:
+            _CTX_BLOCK_CACHE.move_to_end(key)
+            return block
+
+    ranked = sorted(contexts, key=lambda c: c.get("distance", float("inf")))
     chunks = []
-    for c in contexts:
+    total = 0
+    for c in ranked:
         meta = c.get("metadata", {})
         src = meta.get("filename", meta.get("source", ""))
         page = meta.get("page", "?")
-        text = c.get("document", "")
-        chunks.append(f"Source: {src} p{page}\n{text}")
-    return "\n\n---\n\n".join(chunks)
+        text = c.get("document", "")[:max_ctx_chars]
+        chunk = f"Source: {src} p{page}\n{text}"
+        if chunks and total + len(chunk) > max_total_chars:
+            break
+        chunks.append(chunk)
+        total += len(chunk)
+    block = "\n\n---\n\n".join(chunks)
+
+    with _ctx_block_lock:
+        _CTX_BLOCK_CACHE[key] = block
+        while len(_CTX_BLOCK_CACHE) > _CTX_BLOCK_CACHE_SIZE:
+            _CTX_BLOCK_CACHE.popitem(last=False)
+    return block
+
+
+def build_messages(query: str, contexts: List[Dict], style: str | None = None) -> List[Dict[str, str]]:
+    context_block = format_context_block(contexts)
+    prompt = f"Context:\n{context_block}\n\nQuestion: {query}\nAnswer:"
+
+    system_message = SYSTEM_PROMPT
+    if style:
+        if style.lower() == "concise":
+            system_message += " Focus on brevity. Use at most 6–8 bullets in the procedure."
+        elif style.lower() == "detailed":
+            system_message += " Provide rich, detailed steps and short rationale where helpful."
+    return [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": prompt},
+    ]
 
 
 def answer_with_citations(
@@ -58,22 +165,10 @@ def answer_with_citations(
     if client is None:
         return "[LLM disabled] Provide GROQ_API_KEY in .env. Proceed with retrieved sources below."
 
-    context_block = format_context_block(contexts)
-    prompt = f"Context:\n{context_block}\n\nQuestion: {query}\nAnswer:"
-
     try:
-        system_message = SYSTEM_PROMPT
-        if style:
-            if style.lower() == "concise":
-                system_message += " Focus on brevity. Use at most 6–8 bullets in the procedure."
-            elif style.lower() == "detailed":
-                system_message += " Provide rich, detailed steps and short rationale where helpful."
         resp = client.chat.completions.create(
             model=GROQ_MODEL,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt},
-            ],
+            messages=build_messages(query, contexts, style),
             temperature=temperature,
             max_tokens=max_tokens,
         )
@@ -82,6 +177,38 @@ def answer_with_citations(
         return f"[LLM error] {e}. Proceed with retrieved sources below."
 
 
+async def aanswer_with_citations(
+    query: str,
+    contexts: List[Dict],
+    temperature: float = 0.2,
+    max_tokens: int = 768,
+    style: str | None = None,
+) -> str:
+    """Async variant of `answer_with_citations`, usable from any event loop.
+
+    The request runs on the shared LLM loop, so all callers share one
+    AsyncGroq client and at most GROQ_MAX_CONCURRENCY requests are in flight.
+    """
+    if not GROQ_API_KEY or AsyncGroq is None:
+        return "[LLM disabled] Provide GROQ_API_KEY in .env. Proceed with retrieved sources below."
+
+    messages = build_messages(query, contexts, style)
+    try:
+        fut = asyncio.run_coroutine_threadsafe(
+            _acreate_completion(
+                model=GROQ_MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            ),
+            get_llm_loop(),
+        )
+        resp = await asyncio.wrap_future(fut)
+        return (resp.choices[0].message.content or "").strip()
+    except Exception as e:
+        return f"[LLM error] {e}. Proceed with retrieved sources below."
+
+
 def stream_answer_with_citations(
     query: str,
     contexts: List[Dict],
@@ -100,23 +227,10 @@ def stream_answer_with_citations(
         yield "[LLM disabled] Provide GROQ_API_KEY in .env. Proceed with retrieved sources below."
         return
 
-    context_block = format_context_block(contexts)
-    prompt = f"Context:\n{context_block}\n\nQuestion: {query}\nAnswer:"
-
-    system_message = SYSTEM_PROMPT
-    if style:
-        if style.lower() == "concise":
-            system_message += " Focus on brevity. Use at most 6–8 bullets in the procedure."
-        elif style.lower() == "detailed":
-            system_message += " Provide rich, detailed steps and short rationale where helpful."
-
     try:
         stream = client.chat.completions.create(
             model=GROQ_MODEL,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt},
-            ],
+            messages=build_messages(query, contexts, style),
             temperature=temperature,
             max_tokens=max_tokens,
             stream=True,
@@ -1,37 +1,66 @@
 from __future__ import annotations
 import os
-from pathlib import Path
 from typing import List, Dict
 
 import streamlit as st
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-import chromadb
 import requests
 
-from agents.graph import invoke_graph
-from agents.llm import stream_answer_with_citations  # optional direct use if needed
+from agents.graph import get_embedder_pool, stream_graph
+from agents.llm import stream_answer_with_citations
+from ingestion.embedding import encode_float32
 
 # ---- Env and Config ----
 load_dotenv()
-CHROMA_DB_DIR = os.environ.get("CHROMA_DB_DIR", "data/chroma")
-EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
-COLLECTION_NAME = "pwb_docs"
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 
-# ---- Lazy singletons ----
-@st.cache_resource(show_spinner=False)
-def get_embedder():
-    return SentenceTransformer(EMBEDDING_MODEL)
+# Embedding model and Chroma collection are process-wide singletons in agents.graph
+def embed_query(texts: List[str]):
+    with get_embedder_pool().acquire() as model:
+        return encode_float32(model, texts, normalize_embeddings=True)
 
+
+# Keep-alive session for Ops API calls; cached so script reruns reuse its connections
 @st.cache_resource(show_spinner=False)
-def get_chroma():
-    client = chromadb.PersistentClient(path=str(Path(CHROMA_DB_DIR)))
-    return client.get_or_create_collection(COLLECTION_NAME)
+def get_ops_session() -> requests.Session:
+    session = requests.Session()
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+
+# Runs as a fragment so Approve/Deny clicks rerun only this panel, not the chat
+@st.fragment
+def action_panel():
+    last = st.session_state.get("last_result")
+    proposed = (last or {}).get("proposed_action")
+    if proposed and proposed.get("type") != "unknown":
+        st.json(proposed)
+        colA, colB = st.columns(2)
+        with colA:
+            approve = st.button("Approve Action", type="primary")
+        with colB:
+            deny = st.button("Deny Action")
+        if approve:
+            ops_url = os.environ.get("OPS_API_URL", "http://localhost:8001")
+            operator = os.environ.get("OPERATOR_NAME", "demo_user")
+            try:
+                endpoint = {
+                    "pause_item": "/pause_item",
+                    "unpause_item": "/unpause_item",
+                    "update_hours": "/update_hours",
+                }.get(proposed.get("type"), "/unknown")
+                payload = {**proposed, "operator": operator}
+                r = get_ops_session().post(f"{ops_url}{endpoint}", json=payload, timeout=10)
+                if r.ok:
+                    st.success("Action executed and audited.")
+                else:
+                    st.error(f"Action failed: {r.status_code} {r.text}")
+            except Exception as e:
+                st.error(f"Action error: {e}")
+    else:
+        st.caption("No action proposed.")
+
 
-def embed_query(texts: List[str]):
-    model = get_embedder()
-    return model.encode(texts, normalize_embeddings=True).tolist()
 # ---- UI ----
 st.set_page_config(page_title="PWB Agentic POC", layout="wide")
 st.title("PWB Agentic POC — Knowledge & Actions (RAG Preview)")
@@ -54,7 +83,18 @@ prompt = st.chat_input("Ask a question about finance, ops, onboarding, or platfo
 if prompt:
     # Run LangGraph pipeline with style/temperature controls
     st.session_state.decision_log = []  # reset per turn for clarity
-    result = invoke_graph(query=prompt, top_k=top_k, style=style, temperature=temperature)
+    # stream=True: the graph only retrieves; the answer is streamed below
+    with st.status("Routing ...", expanded=True) as status:
+        # Each step is written as its node finishes, not after the whole run
+        result: Dict = {}
+        shown = 0
+        for node, result in stream_graph(query=prompt, top_k=top_k, style=style, temperature=temperature, stream=True):
+            steps = result.get("log", [])
+            for step in steps[shown:]:
+                st.write(step)
+            shown = len(steps)
+            status.update(label=f"{node.title()} done ...")
+        status.update(label=f"Intent: {result.get('intent', 'knowledge')}", state="complete", expanded=False)
 
     # Chat transcript: show user message immediately
     st.session_state.history.append({"role": "user", "content": prompt})
@@ -63,19 +103,18 @@ if prompt:
     with st.chat_message("assistant"):
         placeholder = st.empty()
         streamed = ""
-        # Reuse retrieved contexts from result to drive streamed answering if available
-        contexts = result.get("contexts", [])
-        if contexts:
+        # Knowledge turns are answered here from the retrieved contexts
+        if result.get("intent") == "knowledge":
             for chunk in stream_answer_with_citations(
                 prompt,
-                contexts,
+                result.get("contexts", []),
                 temperature=temperature,
                 style=style,
             ):
                 streamed += chunk
                 placeholder.markdown(streamed)
         else:
-            # Fallback to the non-streamed answer if no contexts
+            # Action turns carry their answer from the graph
             streamed = result.get("answer", "")
             placeholder.markdown(streamed)
 
@@ -112,31 +151,4 @@ with col2:
 
     # Action approval flow (stub)
     st.subheader("Proposed Action")
-    last = st.session_state.get("last_result")
-    proposed = (last or {}).get("proposed_action")
-    if proposed and proposed.get("type") != "unknown":
-        st.json(proposed)
-        colA, colB = st.columns(2)
-        with colA:
-            approve = st.button("Approve Action", type="primary")
-        with colB:
-            deny = st.button("Deny Action")
-        if approve:
-            ops_url = os.environ.get("OPS_API_URL", "http://localhost:8001")
-            operator = os.environ.get("OPERATOR_NAME", "demo_user")
-            try:
-                endpoint = {
-                    "pause_item": "/pause_item",
-                    "unpause_item": "/unpause_item",
-                    "update_hours": "/update_hours",
-                }.get(proposed.get("type"), "/unknown")
-                payload = {**proposed, "operator": operator}
-                r = requests.post(f"{ops_url}{endpoint}", json=payload, timeout=10)
-                if r.ok:
-                    st.success("Action executed and audited.")
-                else:
-                    st.error(f"Action failed: {r.status_code} {r.text}")
-            except Exception as e:
-                st.error(f"Action error: {e}")
-    else:
-        st.caption("No action proposed.")
+    action_panel()
@@ -1,10 +1,16 @@
 from __future__ import annotations
-import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any
-from datetime import datetime
+from typing import Optional, Dict, Any, List
 
+import orjson
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ConfigDict
 
 DATA_DIR = Path("data")
@@ -12,6 +18,11 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 STATE_FILE = DATA_DIR / "ops_state.json"
 AUDIT_FILE = DATA_DIR / "audit.log"
 
+AUDIT_FLUSH_INTERVAL = 0.1  # seconds between audit log flushes
+STATE_FLUSH_INTERVAL = 0.2  # minimum seconds between state snapshots
+
+logger = logging.getLogger(__name__)
+
 
 class ActionPayload(BaseModel):
     model_config = ConfigDict(extra="allow")  # accept flexible fields from UI
@@ -30,26 +41,132 @@ class OpsState(BaseModel):
     hours_note: str = ""
 
 
+# ---- State (in memory, snapshotted to STATE_FILE by the writer thread) ----
+_STATE: Optional[OpsState] = None
+_state_dirty = False
+_state_version = 0  # bumped on every save, so a flush only clears what it wrote
+_state_lock = threading.RLock()
+
+
 def load_state() -> OpsState:
-    if STATE_FILE.exists():
-        try:
-            return OpsState(**json.loads(STATE_FILE.read_text()))
-        except Exception:
-            pass
-    return OpsState()
+    """Return the live state, reading STATE_FILE only on first use."""
+    global _STATE
+    with _state_lock:
+        if _STATE is None:
+            _STATE = OpsState()
+            if STATE_FILE.exists():
+                try:
+                    _STATE = OpsState(**orjson.loads(STATE_FILE.read_bytes()))
+                except Exception:
+                    pass
+        return _STATE
 
 
 def save_state(state: OpsState) -> None:
-    STATE_FILE.write_text(state.model_dump_json(indent=2))
+    """Mark the state for the next debounced snapshot."""
+    global _STATE, _state_dirty, _state_version
+    with _state_lock:
+        _STATE = state
+        _state_dirty = True
+        _state_version += 1
+
+
+def flush_state() -> None:
+    """Snapshot the state if it changed; it stays dirty if the write fails."""
+    global _state_dirty
+    with _state_lock:
+        if not _state_dirty or _STATE is None:
+            return
+        data = orjson.dumps(_STATE.model_dump(), option=orjson.OPT_INDENT_2)
+        version = _state_version
+    STATE_FILE.write_bytes(data)
+    with _state_lock:
+        if _state_version == version:
+            _state_dirty = False
+
+
+# ---- Audit log (queued, appended in batches by the writer thread) ----
+_AUDIT_Q: "queue.SimpleQueue[bytes]" = queue.SimpleQueue()
+_audit_write_lock = threading.Lock()
+# Lines drained from the queue whose write failed; retried first, in order
+_audit_pending: List[bytes] = []
+
+
+# (epoch second, "YYYY-MM-DDTHH:MM:SS") formatted once per second; replaced
+# as a whole tuple so concurrent readers never see a mismatched pair
+_TS_CACHE: tuple = (-1, "")
+
+
+def _now_iso() -> str:
+    """UTC timestamp like 2024-01-31T12:00:00.123456Z."""
+    global _TS_CACHE
+    now = time.time()
+    sec = int(now)
+    cached_sec, prefix = _TS_CACHE
+    if sec != cached_sec:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        _TS_CACHE = (sec, prefix)
+    return f"{prefix}.{int((now - sec) * 1e6):06d}Z"
 
 
 def append_audit(entry: Dict[str, Any]) -> None:
-    entry["ts"] = datetime.utcnow().isoformat() + "Z"
-    with AUDIT_FILE.open("a") as f:
-        f.write(json.dumps(entry) + "\n")
+    entry["ts"] = _now_iso()
+    _AUDIT_Q.put(orjson.dumps(entry))
+
+
+def flush_audit() -> None:
+    """Append queued entries with one write and fsync.
+
+    On failure the drained lines are kept and retried ahead of newer ones.
+    """
+    with _audit_write_lock:
+        while True:
+            try:
+                _audit_pending.append(_AUDIT_Q.get_nowait())
+            except queue.Empty:
+                break
+        if not _audit_pending:
+            return
+        with AUDIT_FILE.open("ab") as f:
+            f.write(b"\n".join(_audit_pending) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _audit_pending.clear()
+
+
+def _writer_loop(stop: threading.Event) -> None:
+    last_state_flush = 0.0
+    while not stop.wait(AUDIT_FLUSH_INTERVAL):
+        # Keep the thread alive through I/O errors (disk full, permissions);
+        # unwritten data stays pending for the next pass
+        try:
+            flush_audit()
+        except Exception:
+            logger.exception("Audit log flush failed; will retry")
+        now = time.monotonic()
+        if now - last_state_flush >= STATE_FLUSH_INTERVAL:
+            try:
+                flush_state()
+            except Exception:
+                logger.exception("State snapshot failed; will retry")
+            last_state_flush = now
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop = threading.Event()
+    writer = threading.Thread(target=_writer_loop, args=(stop,), name="ops-writer", daemon=True)
+    writer.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        writer.join()
+        flush_audit()
+        flush_state()
 
-app = FastAPI(title="Ops Stub API", version="0.1.0")
+
+app = FastAPI(title="Ops Stub API", version="0.1.0", lifespan=lifespan)
 
 
 @app.get("/health")
@@ -61,47 +178,57 @@ def health():
 def pause_item(payload: ActionPayload):
     if not payload.item:
         raise HTTPException(status_code=400, detail="Missing 'item' in payload")
-    state = load_state()
-    state.items[payload.item] = "paused"
-    save_state(state)
+    with _state_lock:
+        state = load_state()
+        state.items[payload.item] = "paused"
+        save_state(state)
+        snapshot = state.model_dump()
     append_audit({"action": "pause_item", **payload.model_dump()})
-    return {"ok": True, "message": f"Paused item '{payload.item}'", "state": state.model_dump()}
+    return {"ok": True, "message": f"Paused item '{payload.item}'", "state": snapshot}
 
 
 @app.post("/unpause_item")
 def unpause_item(payload: ActionPayload):
     if not payload.item:
         raise HTTPException(status_code=400, detail="Missing 'item' in payload")
-    state = load_state()
-    state.items[payload.item] = "active"
-    save_state(state)
+    with _state_lock:
+        state = load_state()
+        state.items[payload.item] = "active"
+        save_state(state)
+        snapshot = state.model_dump()
     append_audit({"action": "unpause_item", **payload.model_dump()})
-    return {"ok": True, "message": f"Unpaused item '{payload.item}'", "state": state.model_dump()}
+    return {"ok": True, "message": f"Unpaused item '{payload.item}'", "state": snapshot}
 
 
 @app.post("/update_hours")
 def update_hours(payload: ActionPayload):
-    state = load_state()
     note = payload.details or payload.original_query or "updated hours"
-    state.hours_note = note
-    save_state(state)
+    with _state_lock:
+        state = load_state()
+        state.hours_note = note
+        save_state(state)
+        snapshot = state.model_dump()
     append_audit({"action": "update_hours", **payload.model_dump()})
-    return {"ok": True, "message": "Hours updated", "note": note, "state": state.model_dump()}
+    return {"ok": True, "message": "Hours updated", "note": note, "state": snapshot}
 
 
 @app.get("/state")
 def get_state():
-    return load_state()
+    with _state_lock:
+        return load_state().model_dump()
+
+
+def _iter_audit_lines():
+    if not AUDIT_FILE.exists():
+        return
+    with AUDIT_FILE.open("rb") as f:
+        for line in f:
+            if line.strip():
+                yield line
 
 
 @app.get("/audit")
 def get_audit():
-    entries = []
-    if AUDIT_FILE.exists():
-        with AUDIT_FILE.open() as f:
-            for line in f:
-                try:
-                    entries.append(json.loads(line))
-                except Exception:
-                    pass
-    return {"count": len(entries), "entries": entries}
+    """Stream the audit log as NDJSON (one entry per line)."""
+    flush_audit()  # include entries still waiting for the writer thread
+    return StreamingResponse(_iter_audit_lines(), media_type="application/x-ndjson")
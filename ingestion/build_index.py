@@ -1,19 +1,30 @@
 from __future__ import annotations
 import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 import chromadb
+import numpy as np
 import sys
 
 # Robust import so this file works both as a module and as a script
 try:  # If executed with `python -m ingestion.build_index`
     if __package__:
         from .chunking import load_pdfs, chunk_pdf  # type: ignore
+        from .embedding import (  # type: ignore
+            EMBEDDING_PRECISIONS,
+            calibrate_int8,
+            encode_float32,
+            int8_ranges_path,
+            load_embedder,
+            quantize_int8,
+            save_flat_index,
+        )
     else:
         raise ImportError
 except Exception:
@@ -23,10 +34,26 @@ except Exception:
     if str(_root) not in sys.path:
         sys.path.append(str(_root))
     from ingestion.chunking import load_pdfs, chunk_pdf  # type: ignore
+    from ingestion.embedding import (  # type: ignore
+        EMBEDDING_PRECISIONS,
+        calibrate_int8,
+        encode_float32,
+        int8_ranges_path,
+        load_embedder,
+        quantize_int8,
+        save_flat_index,
+    )
 
 
 DEFAULT_COLLECTION = "pwb_docs"
 
+# HNSW graph parameters, fixed when the collection is created
+HNSW_PARAMS = {
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
+
 
 def get_env(key: str, default: str) -> str:
     return os.environ.get(key, default)
@@ -52,7 +79,12 @@ def build_index(
     batch_size: int = 64,
     chunk_size: int = 900,
     overlap: int = 150,
+    precision: str = "float32",
+    workers: Optional[int] = None,
 ):
+    if precision not in EMBEDDING_PRECISIONS:
+        raise ValueError(f"Unsupported precision {precision!r}; expected one of {EMBEDDING_PRECISIONS}")
+
     source_dir.mkdir(parents=True, exist_ok=True)
     persist_dir.mkdir(parents=True, exist_ok=True)
 
@@ -61,14 +93,20 @@ def build_index(
         print(f"No PDFs found in {source_dir}. Add files or run scripts/generate_pdfs.py")
         return
 
-    print(f"Loading embedding model: {model_name}")
-    model = SentenceTransformer(model_name)
-
-    print(f"Chunking {len(pdf_paths)} PDFs ...")
+    # PDF parsing is pure-Python and GIL-bound, so fan out across processes
+    workers = min(workers or os.cpu_count() or 1, len(pdf_paths))
+    print(f"Chunking {len(pdf_paths)} PDFs with {workers} worker(s) ...")
+    chunk_one = partial(chunk_pdf, chunk_size=chunk_size, overlap=overlap)
     all_chunks: List[Dict] = []
-    for p in tqdm(pdf_paths, desc="PDFs"):
-        chunks = chunk_pdf(p, chunk_size=chunk_size, overlap=overlap)
-        all_chunks.extend(chunks)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            # About four tasks per worker, so small corpora still reach every process
+            chunksize = max(1, len(pdf_paths) // (workers * 4))
+            for chunks in tqdm(ex.map(chunk_one, pdf_paths, chunksize=chunksize), total=len(pdf_paths), desc="PDFs"):
+                all_chunks.extend(chunks)
+    else:
+        for p in tqdm(pdf_paths, desc="PDFs"):
+            all_chunks.extend(chunk_one(p))
 
     if not all_chunks:
         print("No text chunks extracted; check your PDFs.")
@@ -76,19 +114,42 @@ def build_index(
 
     print(f"Total chunks: {len(all_chunks)}")
 
+    # Load the model only after the chunking workers are done: forking once
+    # torch/onnxruntime thread pools exist can deadlock, and the children
+    # would inherit the model memory for nothing
+    print(f"Loading embedding model: {model_name}")
+    model = load_embedder(model_name)
+
     print(f"Initializing Chroma persistent client at {persist_dir}")
     client = chromadb.PersistentClient(path=str(persist_dir))
 
+    # Embeddings are normalized, so cosine ranks like L2; int8 vectors are
+    # compared by inner product, as in sentence-transformers' quantized retrieval
+    coll_metadata: Dict = {
+        "embedding_precision": precision,
+        "hnsw:space": "ip" if precision == "int8" else "cosine",
+        "hnsw:num_threads": os.cpu_count() or 1,
+        **HNSW_PARAMS,
+    }
+
     if rebuild:
         try:
             client.delete_collection(collection_name)
             print(f"Deleted existing collection: {collection_name}")
         except Exception:
             pass
-        collection = client.create_collection(collection_name)
+        collection = client.create_collection(collection_name, metadata=coll_metadata)
     else:
-        # get_or_create ensures idempotent behavior across runs
-        collection = client.get_or_create_collection(collection_name)
+        # Reuse an existing collection so runs stay idempotent; its metadata is fixed at creation
+        try:
+            collection = client.get_collection(collection_name)
+        except Exception:
+            collection = client.create_collection(collection_name, metadata=coll_metadata)
+        existing = (collection.metadata or {}).get("embedding_precision", "float32")
+        if existing != precision:
+            raise ValueError(
+                f"Collection '{collection_name}' stores {existing} embeddings; rerun with --rebuild to switch to {precision}"
+            )
 
     print(f"Indexing into collection: {collection_name}")
 
@@ -97,17 +158,41 @@ def build_index(
     ids = [c["id"] for c in all_chunks]
     metas = [c["metadata"] for c in all_chunks]
 
-    # Embed and write in batches
+    # Embed everything in one call so int8 calibration sees the whole corpus.
+    # encode() sorts inputs by length before batching (and restores the
+    # original order), so each batch pads to near-uniform length.
     total = len(docs)
-    pbar = tqdm(total=total, desc="Embedding + Writing")
+    print("Embedding chunks ...")
+    all_embeds = encode_float32(
+        model,
+        docs,
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        show_progress_bar=True,
+    )
+    if precision == "int8":
+        ranges_file = int8_ranges_path(persist_dir, collection_name)
+        if ranges_file.exists() and not rebuild:
+            # Keep the calibration the stored vectors were quantized with
+            ranges = np.load(ranges_file)
+        else:
+            ranges = calibrate_int8(all_embeds)
+            np.save(ranges_file, ranges)
+        all_embeds = quantize_int8(all_embeds, ranges)
+
+    # Memory-mappable copy of the whole index for INDEX_BACKEND=flat
+    save_flat_index(persist_dir, collection_name, all_embeds, ids, docs, metas)
 
-    for idxs in (range(i, min(i + batch_size, total)) for i in range(0, total, batch_size)):
-        idxs = list(idxs)
-        batch_docs = [docs[i] for i in idxs]
-        batch_ids = [ids[i] for i in idxs]
-        batch_metas = [metas[i] for i in idxs]
+    # Write in batches
+    pbar = tqdm(total=total, desc="Writing")
 
-        embeds = model.encode(batch_docs, normalize_embeddings=True).tolist()
+    for start in range(0, total, batch_size):
+        end = min(start + batch_size, total)
+        batch_docs = docs[start:end]
+        batch_ids = ids[start:end]
+        batch_metas = metas[start:end]
+
+        embeds = all_embeds[start:end].astype(np.float32, copy=False)
 
         # Prefer upsert if available; fallback to add/update combo
         if hasattr(collection, "upsert"):
@@ -154,6 +239,13 @@ if __name__ == "__main__":
     parser.add_argument("--batch-size", type=int, default=64, help="Embedding/write batch size")
     parser.add_argument("--chunk-size", type=int, default=900, help="Chunk size (characters)")
     parser.add_argument("--overlap", type=int, default=150, help="Chunk overlap (characters)")
+    parser.add_argument(
+        "--precision",
+        choices=EMBEDDING_PRECISIONS,
+        default=get_env("EMBEDDING_PRECISION", "float32"),
+        help="Stored embedding precision (int8 requires --rebuild when switching)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="PDF extraction processes (default: CPU count)")
 
     args = parser.parse_args()
 
@@ -170,4 +262,6 @@ if __name__ == "__main__":
         batch_size=args.batch_size,
         chunk_size=args.chunk_size,
         overlap=args.overlap,
+        precision=args.precision,
+        workers=args.workers,
     )
@@ -21,17 +21,14 @@ def extract_text_from_pdf(pdf_path: Path) -> List[Dict]:
 
 def split_text(text: str, chunk_size: int = 900, overlap: int = 150) -> List[str]:
     """Simple character-based splitter with overlap."""
-    chunks = []
-    start = 0
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("overlap must be smaller than chunk_size")
     n = len(text)
-    while start < n:
-        end = min(start + chunk_size, n)
-        chunk = text[start:end]
-        chunks.append(chunk)
-        if end == n:
-            break
-        start = max(0, end - overlap)
-    return chunks
+    if n <= chunk_size:
+        return [text] if text else []
+    # Chunk starts are fixed offsets; the last one is the first chunk reaching the end
+    return [text[s : s + chunk_size] for s in range(0, n - chunk_size + step, step)]
 
 
 def chunk_pdf(pdf_path: Path, chunk_size: int = 900, overlap: int = 150) -> List[Dict]:
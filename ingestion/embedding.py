@@ -0,0 +1,104 @@
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+
+def _onnx_provider() -> str:
+    try:
+        import onnxruntime  # type: ignore
+    except Exception:  # pragma: no cover
+        return "CPUExecutionProvider"
+    if "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+        return "CUDAExecutionProvider"
+    return "CPUExecutionProvider"
+
+
+def load_embedder(model_name: str) -> SentenceTransformer:
+    """Load the sentence-transformers model with the configured backend.
+
+    EMBEDDING_BACKEND selects "torch" (default), "onnx" or "openvino". The
+    torch backend runs in fp16 on CUDA and fp32 on CPU. For ONNX,
+    EMBEDDING_ONNX_FILE picks a pre-exported graph inside the model repo,
+    e.g. "onnx/model_O4.onnx" or a dynamic-int8 CPU export such as
+    "onnx/model_qint8_avx512_vnni.onnx"; otherwise the stock export is used.
+    """
+    backend = os.environ.get("EMBEDDING_BACKEND", "torch").lower()
+    if backend == "torch":
+        import torch
+
+        # Pass the device to the constructor rather than calling .to() afterwards,
+        # which leaves sentence-transformers' target device out of sync
+        if torch.cuda.is_available():
+            return SentenceTransformer(model_name, device="cuda", model_kwargs={"torch_dtype": torch.float16})
+        return SentenceTransformer(model_name, device="cpu")
+
+    model_kwargs: Dict[str, Any] = {}
+    onnx_file = os.environ.get("EMBEDDING_ONNX_FILE")
+    if backend == "onnx":
+        model_kwargs["provider"] = _onnx_provider()
+        if onnx_file:
+            model_kwargs["file_name"] = onnx_file
+    return SentenceTransformer(model_name, backend=backend, model_kwargs=model_kwargs)
+
+
+def encode_float32(model: SentenceTransformer, texts: List[str], **kwargs: Any) -> np.ndarray:
+    """model.encode() as a float32 ndarray.
+
+    An fp16 model (torch on CUDA) returns float16; casting here keeps
+    calibration, the flat index and the query cache in float32.
+    """
+    return model.encode(texts, convert_to_numpy=True, **kwargs).astype(np.float32, copy=False)
+
+
+# ---- Scalar (int8) quantization ----
+EMBEDDING_PRECISIONS = ("float32", "int8")
+
+
+def int8_ranges_path(persist_dir: Path, collection_name: str) -> Path:
+    return persist_dir / f"{collection_name}_int8_ranges.npy"
+
+
+def calibrate_int8(embeddings: np.ndarray) -> np.ndarray:
+    """Per-dimension (min, max) calibration, shape (2, dim)."""
+    return np.stack([embeddings.min(axis=0), embeddings.max(axis=0)])
+
+
+def quantize_int8(embeddings: np.ndarray, ranges: np.ndarray) -> np.ndarray:
+    """Map float embeddings onto 256 buckets per dimension using `ranges`.
+
+    Values outside the calibration range (typical for queries) are clipped
+    instead of wrapping around.
+    """
+    starts = ranges[0]
+    steps = (ranges[1] - ranges[0]) / 255
+    steps = np.where(steps == 0, 1.0, steps)
+    scaled = (embeddings - starts) / steps - 128
+    return np.clip(np.rint(scaled), -128, 127).astype(np.int8)
+
+
+# ---- Flat index files (read by agents.flat_index.FlatIndex) ----
+def embeds_path(persist_dir: Path, collection_name: str) -> Path:
+    return persist_dir / f"{collection_name}_embeds.npy"
+
+
+def records_path(persist_dir: Path, collection_name: str) -> Path:
+    return persist_dir / f"{collection_name}_records.json"
+
+
+def save_flat_index(
+    persist_dir: Path,
+    collection_name: str,
+    embeds: np.ndarray,
+    ids: List[str],
+    documents: List[str],
+    metadatas: List[Dict],
+) -> None:
+    """Write the (N, dim) embedding matrix and its id/document/metadata sidecar."""
+    np.save(embeds_path(persist_dir, collection_name), np.ascontiguousarray(embeds))
+    records = {"ids": ids, "documents": documents, "metadatas": metadatas}
+    records_path(persist_dir, collection_name).write_text(json.dumps(records))
@@ -1,26 +1,84 @@
+import bisect
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Sequence, Tuple
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-import textwrap
 
 MARGIN = 50
 LINE_HEIGHT = 16
 MAX_CHARS = 100
+# Sample PDFs are tiny dev fixtures; skip zlib on content streams unless asked
+PDF_COMPRESS = os.environ.get("PWB_PDF_COMPRESS", "0").lower() in ("1", "true", "yes")
+
+
+@functools.lru_cache(maxsize=512)
+def _break_opps(line: str) -> Tuple[int, ...]:
+    """End offsets of the word and space runs in `line` (its break opportunities), computed once per line."""
+    return tuple(i for i in range(1, len(line)) if (line[i - 1] == " ") != (line[i] == " ")) + (len(line),)
+
+
+def _wrap_with_opps(line: str, opps: Sequence[int], width: int) -> List[str]:
+    """Greedy fixed-column wrap over precomputed break opportunities.
+
+    Same result as textwrap.wrap(line, width, break_on_hyphens=False) for a
+    line without tabs: whole word/space runs are packed while they fit, a
+    run longer than `width` is split to fill the current line, and leading
+    spaces survive on the first line only.
+    The same `opps` serve any width, so rewrapping a body for another page
+    size only repeats the forward walk.
+    """
+    out: List[str] = []
+    emit = out.append
+    n = len(line)
+    pos = 0
+    while pos < n:
+        if out and line[pos] == " ":
+            # Drop the space run a continuation line would start with
+            pos = opps[bisect.bisect_right(opps, pos)]
+            if pos == n:
+                break
+        start = pos
+        # Last run boundary within `width` columns (runs are contiguous)
+        k = bisect.bisect_right(opps, start + width) - 1
+        end = opps[k] if k >= 0 and opps[k] > start else start
+        if end < n and opps[bisect.bisect_right(opps, end)] - end > width:
+            # The next run can never fit on a line: split it to fill this one.
+            # Like textwrap, drop only that piece (and only if it is blank).
+            pos = start + width if width >= 1 else end + 1
+            if pos > end and line[end] != " ":
+                end = pos
+        else:
+            pos = end
+            while end > start and line[end - 1] == " ":
+                end -= 1
+        if end > start:
+            emit(line[start:end])
+    return out
+
+
+def _wrap_lines(text: str, width: int) -> Tuple[str, ...]:
+    """All wrapped lines of a (possibly multi-line) text."""
+    return tuple(w for line in text.splitlines() for w in (_wrap_with_opps(line, _break_opps(line), width) or [""]))
 
 
 def draw_wrapped_text(c: canvas.Canvas, text: str, x: int, y: int) -> int:
-    for line in text.splitlines():
-        wrapped = textwrap.wrap(line, width=MAX_CHARS) or [""]
-        for w in wrapped:
-            c.drawString(x, y, w)
-            y -= LINE_HEIGHT
-    return y
+    """Draw wrapped text as a single PDF text object; return the y below it."""
+    lines = _wrap_lines(text, MAX_CHARS)
+    t = c.beginText(x, y)
+    t.setLeading(LINE_HEIGHT)
+    text_line = t.textLine
+    for w in lines:
+        text_line(w)
+    c.drawText(t)
+    return y - LINE_HEIGHT * len(lines)
 
 
-def create_pdf(file_path: Path, title: str, sections: List[Dict[str, str]]):
+def create_pdf(file_path: Path, title: str, sections: Sequence[Tuple[str, str]]):
     file_path.parent.mkdir(parents=True, exist_ok=True)
-    c = canvas.Canvas(str(file_path), pagesize=A4)
+    c = canvas.Canvas(str(file_path), pagesize=A4, pageCompression=int(PDF_COMPRESS))
     width, height = A4
 
     y = height - MARGIN
@@ -28,10 +86,7 @@ def create_pdf(file_path: Path, title: str, sections: List[Dict[str, str]]):
     c.drawString(MARGIN, y, title)
     y -= LINE_HEIGHT * 2
 
-    for sec in sections:
-        heading = sec.get("heading", "")
-        body = sec.get("body", "")
-
+    for heading, body in sections:
         if y < MARGIN + 4 * LINE_HEIGHT:
             c.showPage()
             y = height - MARGIN
@@ -48,207 +103,227 @@ def create_pdf(file_path: Path, title: str, sections: List[Dict[str, str]]):
     c.save()
 
 
+# ---- Sample content: (heading, body) pairs per document ----
+_FINANCE_SECTIONS: Tuple[Tuple[str, str], ...] = (
+    (
+        "Payment Cycles & Statements",
+        (
+            "Payments are issued weekly on Fridays. Statements summarize orders, fees, and adjustments. "
+            "Disputes must be raised within 7 days of receipt."
+        ),
+    ),
+    (
+        "Invoice Re-Send Procedure",
+        (
+            "To re-send an invoice: 1) Identify the partner and billing period; 2) Confirm contact email; "
+            "3) Trigger invoice re-send from Finance Portal; 4) Log the action with timestamp and operator; "
+            "5) Confirm delivery with partner."
+        ),
+    ),
+    (
+        "Reconciliation Basics",
+        (
+            "Reconciliation aligns platform order data with payouts. Typical mismatches include fees, refunds, and "
+            "chargebacks. Use the Reconciliation Report to compare by order ID, then raise adjustments as needed."
+        ),
+    ),
+)
+
+_MENU_OPS_SECTIONS: Tuple[Tuple[str, str], ...] = (
+    (
+        "Pausing / Unpausing Menu Items",
+        (
+            "Items can be paused for stock-outs or quality issues. Suggested policy: if stock-out > 30 minutes, pause the item. "
+            "To unpause, verify availability and quality checks. Log all changes for audit."
+        ),
+    ),
+    (
+        "Updating Opening Hours",
+        (
+            "Adjust hours for holidays or exceptions. Ensure third-party listings reflect the same hours to avoid customer friction. "
+            "Overnight operations should be split by platform guidelines."
+        ),
+    ),
+    (
+        "Promotions & Price Changes",
+        (
+            "Promotions should have a clear objective (conversion, basket size, off-peak fill). Price changes require approval and should be synchronized across platforms."
+        ),
+    ),
+)
+
+_ONBOARDING_SECTIONS: Tuple[Tuple[str, str], ...] = (
+    (
+        "Partner Portal: Getting Started",
+        (
+            "Log in using the invite email. Set up 2FA. Complete profile details (banking, tax, contacts). Access training resources via the Help Center."
+        ),
+    ),
+    (
+        "Reporting Tools",
+        (
+            "Use the Performance dashboard for orders, sales, and cancellations. Export CSVs for deeper analysis. "
+            "Use tags to segment by site or brand."
+        ),
+    ),
+    (
+        "Support & Escalations",
+        (
+            "Use live chat for urgent issues. Finance tickets for payout concerns. Operations tickets for menu/item problems. Escalate service-impacting issues immediately."
+        ),
+    ),
+)
+
+_REPORTING_SECTIONS: Tuple[Tuple[str, str], ...] = (
+    (
+        "Core KPIs",
+        (
+            "Track Orders, Sales, AOV, Cancellation Rate, and On-Time Rate. Review item-level sales mix weekly to identify hero and underperforming items."
+        ),
+    ),
+    (
+        "Recommendations Framework",
+        (
+            "Recommendations should be specific, measurable, and time-bounded. Examples: extend hours on Fri/Sat by 1 hour; promote top-margin items; pause items with high cancellation rates."
+        ),
+    ),
+    (
+        "Data Freshness",
+        (
+            "Ensure data recency before decisions. Use date filters and verify that platform exports have been ingested for the current period."
+        ),
+    ),
+)
+
+# New: Ops portal and Deliverect task guides with field names, SOPs, and edge cases
+_OPS_PORTAL_SECTIONS: Tuple[Tuple[str, str], ...] = (
+    (
+        "Pause / Unpause Menu Items (Deliverect)",
+        (
+            "Navigation: Menus > Items. Fields: Item Name, Availability (toggle), Reason (optional note).\n"
+            "Pause SOP: 1) Search item; 2) Toggle Availability=Off; 3) Add note with stock-out cause and ETA; 4) Save; 5) Verify sync status (should be 'Synced').\n"
+            "Unpause SOP: 1) Confirm stock; 2) Toggle Availability=On; 3) Remove outdated note; 4) Save; 5) Verify sync.\n"
+            "Edge cases: If sync pending >10m, check integration status; if multiple brands, ensure correct brand/site context."
+        ),
+    ),
+    (
+        "Update Opening Hours (Ops Portal)",
+        (
+            "Navigation: Sites > Operating Hours. Fields: Day, Open Time, Close Time, Breaks, Exceptions.\n"
+            "SOP: 1) Select site; 2) Adjust Day row(s); 3) For overnight, split into 2 blocks (e.g., 18:00-23:59 and 00:00-02:00); 4) Add Exceptions for holidays; 5) Save and publish.\n"
+            "Validation: Ensure 3P platforms reflect changes (check monitoring report).\n"
+            "Edge cases: DST changes, bank holidays, split brands at the same site."
+        ),
+    ),
+    (
+        "Promotion Creation Checklist",
+        (
+            "Fields: Promo Name, Start/End, Items, Discount Type/Value, Channels.\n"
+            "SOP: Align with objective (conversion, AOV, off-peak fill); avoid promo stacking; confirm margin impact; sync across platforms."
+        ),
+    ),
+    (
+        "Audit Logging",
+        (
+            "Log each change with timestamp, operator, site/brand, before/after values. Store in immutable log for compliance."
+        ),
+    ),
+    (
+        "FAQs",
+        (
+            "Q: How long do menu changes take to sync? A: Typically <5 minutes; investigate if >10 minutes.\n"
+            "Q: Can I pause multiple items at once? A: Yes, bulk actions are available in Deliverect under Menus > Bulk Edit.\n"
+            "Q: How to handle temporary closures? A: Use Exceptions and add a banner message if supported."
+        ),
+    ),
+)
+
+# New: Third-party platform nuances and remediation checklist
+_THIRD_PARTY_SECTIONS: Tuple[Tuple[str, str], ...] = (
+    (
+        "Platform Nuances (Deliveroo / Just Eat / Uber Eats)",
+        (
+            "Hours formatting: Some platforms require day-by-day entries; overnight hours may need split blocks.\n"
+            "Menu sync: Expect propagation delays (2-10 minutes). Price changes may require approval.\n"
+            "Availability: Some platforms cache availability; force refresh may be needed."
+        ),
+    ),
+    (
+        "Validation Checklist",
+        (
+            "1) Hours match Ops Portal; 2) Menu items present and prices correct; 3) Paused items hidden; 4) Promotions visible; 5) Brand assets and descriptions correct."
+        ),
+    ),
+    (
+        "Discrepancy Types & Actions",
+        (
+            "Hours mismatch: Re-publish hours, confirm timezone.\n"
+            "Missing item: Validate menu mapping and category; trigger re-sync.\n"
+            "Wrong price: Re-publish price list; if still wrong, open platform ticket.\n"
+            "Stale availability: Toggle item availability Off→On to refresh cache."
+        ),
+    ),
+    (
+        "SLAs & Escalation",
+        (
+            "Target remediation: <2h for critical items; <24h for non-critical.\n"
+            "Escalate to platform support if unresolved after two re-sync attempts."
+        ),
+    ),
+    (
+        "FAQs",
+        (
+            "Q: Why do hours look different by platform? A: Formatting rules differ; use split blocks for overnights.\n"
+            "Q: How to verify successful sync? A: Check 'Synced' status in Deliverect and confirm live listing."
+        ),
+    ),
+)
+
+_DOCUMENTS: Tuple[Tuple[str, str, Tuple[Tuple[str, str], ...]], ...] = (
+    (
+        "Finance_Processes_Guide.pdf",
+        "Finance Processes: Payments, Invoicing, Reconciliation",
+        _FINANCE_SECTIONS,
+    ),
+    (
+        "Menu_and_Operations_FAQ.pdf",
+        "Menu & Operations FAQ",
+        _MENU_OPS_SECTIONS,
+    ),
+    (
+        "System_Onboarding_and_Usage.pdf",
+        "System Onboarding & Usage",
+        _ONBOARDING_SECTIONS,
+    ),
+    (
+        "Reporting_and_Insights_Guide.pdf",
+        "Reporting & Insights Guide",
+        _REPORTING_SECTIONS,
+    ),
+    (
+        "Ops_Portal_and_Deliverect_Tasks.pdf",
+        "Ops Portal & Deliverect: Operational Task SOPs",
+        _OPS_PORTAL_SECTIONS,
+    ),
+    (
+        "Third_Party_Platform_Guidelines.pdf",
+        "Third-Party Platforms: Listing Consistency & Remediation",
+        _THIRD_PARTY_SECTIONS,
+    ),
+)
+
+
+def _create_pdf_from_spec(spec: Tuple[Path, str, Sequence[Tuple[str, str]]]) -> None:
+    create_pdf(*spec)
+
+
 def main():
     raw_dir = Path("data/raw")
+    specs = [(raw_dir / filename, title, sections) for filename, title, sections in _DOCUMENTS]
 
-    create_pdf(
-        raw_dir / "Finance_Processes_Guide.pdf",
-        title="Finance Processes: Payments, Invoicing, Reconciliation",
-        sections=[
-            {
-                "heading": "Payment Cycles & Statements",
-                "body": (
-                    "Payments are issued weekly on Fridays. Statements summarize orders, fees, and adjustments. "
-                    "Disputes must be raised within 7 days of receipt."
-                ),
-            },
-            {
-                "heading": "Invoice Re-Send Procedure",
-                "body": (
-                    "To re-send an invoice: 1) Identify the partner and billing period; 2) Confirm contact email; "
-                    "3) Trigger invoice re-send from Finance Portal; 4) Log the action with timestamp and operator; "
-                    "5) Confirm delivery with partner."
-                ),
-            },
-            {
-                "heading": "Reconciliation Basics",
-                "body": (
-                    "Reconciliation aligns platform order data with payouts. Typical mismatches include fees, refunds, and "
-                    "chargebacks. Use the Reconciliation Report to compare by order ID, then raise adjustments as needed."
-                ),
-            },
-        ],
-    )
-
-    create_pdf(
-        raw_dir / "Menu_and_Operations_FAQ.pdf",
-        title="Menu & Operations FAQ",
-        sections=[
-            {
-                "heading": "Pausing / Unpausing Menu Items",
-                "body": (
-                    "Items can be paused for stock-outs or quality issues. Suggested policy: if stock-out > 30 minutes, pause the item. "
-                    "To unpause, verify availability and quality checks. Log all changes for audit."
-                ),
-            },
-            {
-                "heading": "Updating Opening Hours",
-                "body": (
-                    "Adjust hours for holidays or exceptions. Ensure third-party listings reflect the same hours to avoid customer friction. "
-                    "Overnight operations should be split by platform guidelines."
-                ),
-            },
-            {
-                "heading": "Promotions & Price Changes",
-                "body": (
-                    "Promotions should have a clear objective (conversion, basket size, off-peak fill). Price changes require approval and should be synchronized across platforms."
-                ),
-            },
-        ],
-    )
-
-    create_pdf(
-        raw_dir / "System_Onboarding_and_Usage.pdf",
-        title="System Onboarding & Usage",
-        sections=[
-            {
-                "heading": "Partner Portal: Getting Started",
-                "body": (
-                    "Log in using the invite email. Set up 2FA. Complete profile details (banking, tax, contacts). Access training resources via the Help Center."
-                ),
-            },
-            {
-                "heading": "Reporting Tools",
-                "body": (
-                    "Use the Performance dashboard for orders, sales, and cancellations. Export CSVs for deeper analysis. "
-                    "Use tags to segment by site or brand."
-                ),
-            },
-            {
-                "heading": "Support & Escalations",
-                "body": (
-                    "Use live chat for urgent issues. Finance tickets for payout concerns. Operations tickets for menu/item problems. Escalate service-impacting issues immediately."
-                ),
-            },
-        ],
-    )
-
-    create_pdf(
-        raw_dir / "Reporting_and_Insights_Guide.pdf",
-        title="Reporting & Insights Guide",
-        sections=[
-            {
-                "heading": "Core KPIs",
-                "body": (
-                    "Track Orders, Sales, AOV, Cancellation Rate, and On-Time Rate. Review item-level sales mix weekly to identify hero and underperforming items."
-                ),
-            },
-            {
-                "heading": "Recommendations Framework",
-                "body": (
-                    "Recommendations should be specific, measurable, and time-bounded. Examples: extend hours on Fri/Sat by 1 hour; promote top-margin items; pause items with high cancellation rates."
-                ),
-            },
-            {
-                "heading": "Data Freshness",
-                "body": (
-                    "Ensure data recency before decisions. Use date filters and verify that platform exports have been ingested for the current period."
-                ),
-            },
-        ],
-    )
-
-    # New: Ops portal and Deliverect task guides with field names, SOPs, and edge cases
-    create_pdf(
-        raw_dir / "Ops_Portal_and_Deliverect_Tasks.pdf",
-        title="Ops Portal & Deliverect: Operational Task SOPs",
-        sections=[
-            {
-                "heading": "Pause / Unpause Menu Items (Deliverect)",
-                "body": (
-                    "Navigation: Menus > Items. Fields: Item Name, Availability (toggle), Reason (optional note).\n"
-                    "Pause SOP: 1) Search item; 2) Toggle Availability=Off; 3) Add note with stock-out cause and ETA; 4) Save; 5) Verify sync status (should be 'Synced').\n"
-                    "Unpause SOP: 1) Confirm stock; 2) Toggle Availability=On; 3) Remove outdated note; 4) Save; 5) Verify sync.\n"
-                    "Edge cases: If sync pending >10m, check integration status; if multiple brands, ensure correct brand/site context."
-                ),
-            },
-            {
-                "heading": "Update Opening Hours (Ops Portal)",
-                "body": (
-                    "Navigation: Sites > Operating Hours. Fields: Day, Open Time, Close Time, Breaks, Exceptions.\n"
-                    "SOP: 1) Select site; 2) Adjust Day row(s); 3) For overnight, split into 2 blocks (e.g., 18:00-23:59 and 00:00-02:00); 4) Add Exceptions for holidays; 5) Save and publish.\n"
-                    "Validation: Ensure 3P platforms reflect changes (check monitoring report).\n"
-                    "Edge cases: DST changes, bank holidays, split brands at the same site."
-                ),
-            },
-            {
-                "heading": "Promotion Creation Checklist",
-                "body": (
-                    "Fields: Promo Name, Start/End, Items, Discount Type/Value, Channels.\n"
-                    "SOP: Align with objective (conversion, AOV, off-peak fill); avoid promo stacking; confirm margin impact; sync across platforms."
-                ),
-            },
-            {
-                "heading": "Audit Logging",
-                "body": (
-                    "Log each change with timestamp, operator, site/brand, before/after values. Store in immutable log for compliance."
-                ),
-            },
-            {
-                "heading": "FAQs",
-                "body": (
-                    "Q: How long do menu changes take to sync? A: Typically <5 minutes; investigate if >10 minutes.\n"
-                    "Q: Can I pause multiple items at once? A: Yes, bulk actions are available in Deliverect under Menus > Bulk Edit.\n"
-                    "Q: How to handle temporary closures? A: Use Exceptions and add a banner message if supported."
-                ),
-            },
-        ],
-    )
-
-    # New: Third-party platform nuances and remediation checklist
-    create_pdf(
-        raw_dir / "Third_Party_Platform_Guidelines.pdf",
-        title="Third-Party Platforms: Listing Consistency & Remediation",
-        sections=[
-            {
-                "heading": "Platform Nuances (Deliveroo / Just Eat / Uber Eats)",
-                "body": (
-                    "Hours formatting: Some platforms require day-by-day entries; overnight hours may need split blocks.\n"
-                    "Menu sync: Expect propagation delays (2-10 minutes). Price changes may require approval.\n"
-                    "Availability: Some platforms cache availability; force refresh may be needed."
-                ),
-            },
-            {
-                "heading": "Validation Checklist",
-                "body": (
-                    "1) Hours match Ops Portal; 2) Menu items present and prices correct; 3) Paused items hidden; 4) Promotions visible; 5) Brand assets and descriptions correct."
-                ),
-            },
-            {
-                "heading": "Discrepancy Types & Actions",
-                "body": (
-                    "Hours mismatch: Re-publish hours, confirm timezone.\n"
-                    "Missing item: Validate menu mapping and category; trigger re-sync.\n"
-                    "Wrong price: Re-publish price list; if still wrong, open platform ticket.\n"
-                    "Stale availability: Toggle item availability Off→On to refresh cache."
-                ),
-            },
-            {
-                "heading": "SLAs & Escalation",
-                "body": (
-                    "Target remediation: <2h for critical items; <24h for non-critical.\n"
-                    "Escalate to platform support if unresolved after two re-sync attempts."
-                ),
-            },
-            {
-                "heading": "FAQs",
-                "body": (
-                    "Q: Why do hours look different by platform? A: Formatting rules differ; use split blocks for overnights.\n"
-                    "Q: How to verify successful sync? A: Check 'Synced' status in Deliverect and confirm live listing."
-                ),
-            },
-        ],
-    )
+    # The PDFs are independent and ReportLab is GIL-bound, so render them in parallel processes
+    with ProcessPoolExecutor(max_workers=min(len(specs), os.cpu_count() or 1)) as ex:
+        list(ex.map(_create_pdf_from_spec, specs))
 
     print("Generated sample PDFs in data/raw/")
 
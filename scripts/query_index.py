@@ -1,55 +1,93 @@
 from __future__ import annotations
 import argparse
+import functools
 import os
+import sys
 from pathlib import Path
-from typing import List
+from typing import List, Union
 
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-import chromadb
+
+# Allow `python scripts/query_index.py` to import the project packages
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.append(str(_root))
 
 DEFAULT_COLLECTION = "pwb_docs"
+SNIPPET_CHARS = 300
+_NL_TABLE = str.maketrans({"\n": " ", "\r": " ", "\t": " "})
 
 
 def get_env(key: str, default: str) -> str:
     return os.environ.get(key, default)
 
 
-def query_index(query: str, k: int = 4, collection_name: str = DEFAULT_COLLECTION):
+# Heavy imports live inside the cached loaders so `--help` stays fast and
+# repeat calls in one process reuse the loaded model and collection.
+@functools.lru_cache(maxsize=2)
+def _get_model(model_name: str):
+    # Same loader as the app and build_index: honours EMBEDDING_BACKEND and
+    # EMBEDDING_ONNX_FILE (e.g. an int8-quantized ONNX export for CPU)
+    from ingestion.embedding import load_embedder
+
+    print(f"Loading embedding model: {model_name}")
+    return load_embedder(model_name)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_collection(chroma_dir: str, name: str):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=chroma_dir)
+    return client.get_or_create_collection(name)
+
+
+def query_index(queries: Union[str, List[str]], k: int = 4, collection_name: str = DEFAULT_COLLECTION):
+    """Print the top-k matches for one query or a batch of queries.
+
+    A batch is embedded in one encode() call and searched in one Chroma query.
+    """
+    queries = [queries] if isinstance(queries, str) else list(queries)
     chroma_dir = Path(get_env("CHROMA_DB_DIR", "data/chroma"))
     model_name = get_env("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
 
-    print(f"Loading embedding model: {model_name}")
-    model = SentenceTransformer(model_name)
+    model = _get_model(model_name)
+
+    collection = _get_collection(str(chroma_dir), collection_name)
 
-    client = chromadb.PersistentClient(path=str(chroma_dir))
-    collection = client.get_or_create_collection(collection_name)
+    from ingestion.embedding import encode_float32
 
-    q_emb = model.encode([query], normalize_embeddings=True).tolist()
+    q_emb = encode_float32(model, queries, batch_size=32, normalize_embeddings=True)
+    if (collection.metadata or {}).get("embedding_precision") == "int8":
+        import numpy as np
+        from ingestion.embedding import int8_ranges_path, quantize_int8
 
-    res = collection.query(query_embeddings=q_emb, n_results=k, include=["distances", "metadatas", "documents", "embeddings"])  # type: ignore
+        ranges = np.load(int8_ranges_path(chroma_dir, collection_name))
+        q_emb = quantize_int8(q_emb, ranges).astype(np.float32)
 
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
-    dists = res.get("distances", [[]])[0]
+    res = collection.query(query_embeddings=q_emb, n_results=k, include=["distances", "metadatas", "documents"])  # type: ignore
 
-    print("\nTop matches:")
-    for i, (doc, meta, dist) in enumerate(zip(docs, metas, dists), start=1):
-        src = meta.get("filename", meta.get("source", ""))
-        page = meta.get("page", "?")
-        title = meta.get("title", "")
-        print(f"[{i}] {title} (p{page}) — {src} | distance={dist:.4f}")
-        snippet = doc.replace("\n", " ")
-        if len(snippet) > 300:
-            snippet = snippet[:300] + "..."
-        print(f"    {snippet}")
+    parts: List[str] = []
+    for query, docs, metas, dists in zip(queries, res["documents"], res["metadatas"], res["distances"]):
+        parts.append("\nTop matches:" if len(queries) == 1 else f"\nTop matches for: {query}")
+        for i, (doc, meta, dist) in enumerate(zip(docs, metas, dists), start=1):
+            src = meta.get("filename", meta.get("source", ""))
+            page = meta.get("page", "?")
+            title = meta.get("title", "")
+            parts.append(f"[{i}] {title} (p{page}) — {src} | distance={dist:.4f}")
+            # Slice before normalizing so long chunks are not scanned in full
+            snippet = doc[:SNIPPET_CHARS].translate(_NL_TABLE)
+            if len(doc) > SNIPPET_CHARS:
+                snippet += "..."
+            parts.append(f"    {snippet}")
+    sys.stdout.write("\n".join(parts) + "\n")
 
 
 if __name__ == "__main__":
     load_dotenv()
 
     parser = argparse.ArgumentParser(description="Query the Chroma vector DB and view citations.")
-    parser.add_argument("--q", required=True, type=str, help="Query text")
+    parser.add_argument("--q", required=True, type=str, action="append", help="Query text (repeat for a batch)")
     parser.add_argument("--k", type=int, default=4, help="Number of results")
     parser.add_argument("--collection", type=str, default=DEFAULT_COLLECTION, help="Chroma collection name")
 